@@ -2,19 +2,12 @@
 # Imports
 # ------------------------------------------------------------
 import os       # For file and folder handling
-import re       # For regular expression operations (used in ID cleaning)
+import datetime # For caching date cells of annotation workbooks
+import json     # For caching parsed annotation workbooks
+import numpy as np   # For vectorized padj/log2FC filtering
 import pandas as pd  # For data loading, processing, and manipulation
 import csv      # For CSV file operations
-# ------------------------------------------------------------
-# Welcome message
-# ------------------------------------------------------------
-print(
-    "#######\nWelcome to postDESeq2\n"
-    "Place all files in the folder you want to process.\n"
-    "Each file should be tab-delimited and contain the following columns:\n"
-    "GeneID, Base mean, log2FC, StdErr, Wald-Stats, P-value, P-adj.\n"
-    "You will also need to provide an annotation file.\n"
-)
+from concurrent.futures import ProcessPoolExecutor  # For processing input files in parallel
 # ------------------------------------------------------------
 # Species selection mode
 # ------------------------------------------------------------
@@ -23,26 +16,6 @@ print(
 # - "S" = derive 'locus' from GeneID by splitting on '.' before joining
 species = "A"
 
-# ------------------------------------------------------------
-# Load annotation index file
-# ------------------------------------------------------------
-# annotations.xlsx contains two columns:
-#   type      - short code to identify the annotation set
-#   name_file - Excel file name inside the 'annotations/' folder
-annotations = pd.read_excel("annotations.xlsx")
-
-# Display available annotation sets and prompt user to choose one by 'type' code
-annotation = input(
-    f'{annotations[["type", "name_file"]].to_string(index=False)} \n'
-    "Type the code from the 'type' column above to select an annotation file: "
-).upper()
-
-# Retrieve the corresponding annotation file name from the table
-annotation_f = annotations.loc[annotations['type'] == annotation, 'name_file'].item()
-
-# Load the selected annotation Excel file from the 'annotations' folder
-annotation_file = pd.read_excel(f"annotations/{annotation_f}")
-
 # ------------------------------------------------------------
 # Column name constants
 # ------------------------------------------------------------
@@ -51,12 +24,16 @@ Expression = "Expression" # Column name for GOseq-compatible True/False expressi
 
 # Column headers for the annotated output files
 header_name = [
-    "GeneID", "Base mean", "log2FC", "StdErr", "Wald-Stats", "P-value", "P-adj", 'loc', 'Last',
+    "GeneID", "Base mean", "log2FC", "StdErr", "Wald-Stats", "P-value", "P-adj",
     "padj<0.05", "log2FC>0 and padj<0.05", "log2FC<0 and padj<0.05",
     "padj<0.01", "log2FC>1 and padj<0.01",
     "log2FC<-1 and padj<0.01", "(log2FC>1 or log2FC<-1) and padj<0.01"
 ]
 
+# Number of input rows processed at a time; keeps memory use flat for
+# very large DESeq2 tables
+chunk_rows = 200_000
+
 # Short names for each filtering condition — used in output file naming
 lista = [
     "padj_low_005",
@@ -66,463 +43,378 @@ lista = [
     "log2FC_high_1_and_padj_low_001",
     "log2FC_low_minus_1_and_padj_low_001",
     "log2FC_higher_1_or_log2FC_low_minus_1_and_padj_001"
-] 
-
-# Ensure the output directory exists; create it if it doesn't
-isExist = os.path.exists("output") 
-if isExist!=True:
-    os.mkdir("output")
-
-#add solycIDs based on different padj and Log2FC functions
-def padj_low_005(row):
-    """Genes with padj < 0.05."""
-    if row[6] < 0.05:
-        return row[0] 
-    else:
-        return ""
-def log2FC_high_0_padj_low_005(row):
-    """Genes with padj < 0.05 and log2FC > 0 (upregulated)."""
-    if (row[6] < 0.05) and (row[2]>0) :
-        return row[0] 
-    else:
-        return ""
-def log2FC_low_0_and_padj_low005(row):
-    """Genes with padj < 0.05 and log2FC < 0 (downregulated)."""
-    if (row[6] < 0.05) and (row[2]<0):
-        return row[0] 
-    else:
-        return ""
-def padj_low_001(row):
-    """Genes with padj < 0.01."""
-    if row[6] < 0.01:
-        return row[0] 
-    else:
-        return ""        
-def log2FC_high_1_and_padj_low_001(row):
-    """Genes with padj < 0.01 and log2FC > 1 (strong upregulation)."""
-    if (row[6] < 0.01) and (row[2]>1):
-        return row[0] 
-    else:
-        return ""
-def log2FC_low_minus_1_and_padj_low_001(row):
-    """Genes with padj < 0.01 and log2FC < -1 (strong downregulation)."""
-    if (row[6] < 0.01) and (row[2]<-1):
-        return row[0] 
-    else:
-        return ""
-def log2FC_higher_1_or_log2FC_low_minus_1_and_padj_001(row):
-    """Genes with padj < 0.01 and |log2FC| > 1 (strong up/down regulation)."""
-    if (row[6] < 0.01) and ((row[2]<-1) or (row[2]>1) ):
-        return row[0] 
-    else:
-        return ""
+]
 
-# ------------------------------------------------------------
-# Create annotated files and classify genes into subsets
-# based on padj and log2FC thresholds (UP/DOWN regulated)
-# ------------------------------------------------------------
 
-for file_name in os.listdir('input'):
-    # --------------------------------------------------------
-    # Load DESeq2 result file
-    # --------------------------------------------------------
-    df = pd.read_csv(
-        f"input/{file_name}",
-        header=None,        # no header expected
-        sep=r'\s+',         # split on any whitespace (tabs or spaces)
-        decimal='.'         # decimal separator is a dot
-    )
+def threshold_masks(padj, lfc):
+    """Return the seven padj/log2FC filter masks, in the same order as `lista`."""
+    sig_005 = padj < 0.05
+    sig_001 = padj < 0.01
+    strong_up = lfc > 1
+    strong_down = lfc < -1
+    return [
+        sig_005,                               # padj < 0.05
+        sig_005 & (lfc > 0),                   # upregulated
+        sig_005 & (lfc < 0),                   # downregulated
+        sig_001,                               # padj < 0.01
+        sig_001 & strong_up,                   # strong up
+        sig_001 & strong_down,                 # strong down
+        sig_001 & (strong_up | strong_down),   # strong up/down
+    ]
 
-    # Optional lines if input uses commas or has headers:
-    # df = df.iloc[1:, :]                      # drop header row
-    # df = df.rename(columns=df.iloc[0])       # use first row as header
 
-    # Convert relevant numeric columns to float
-    # Column index: 1=Base mean, 2=log2FC, 3=StdErr, 4=Wald-Stats, 5=P-value, 6=P-adj
-    df = df.astype({2: 'float', 1: 'float', 3: 'float', 4: 'float', 5: 'float', 6: 'float'})
+def write_table(df, path, append=False):
+    """Write a DataFrame as a tab-delimited table without the index.
 
-    # --------------------------------------------------------
-    # Ensure annotated output directory exists
-    # --------------------------------------------------------
-    if not os.path.exists("output/annotated"):
-        os.mkdir("output/annotated")
+    With `append=True` the rows are added to the end of an existing table
+    without repeating the header (used for every chunk after the first).
 
-    # --------------------------------------------------------
-    # Clean up GeneID column and prepare locus columns
-    # --------------------------------------------------------
-    # Remove 'gene:' prefix from GeneID strings
-    df = df.replace({0: 'gene:'}, {0: ''}, regex=True)
+    All outputs go through pandas' to_csv; pyarrow's CSV writer was
+    considered, but it quotes every string field, which GOseq input
+    tables must not have.
 
-    # Copy GeneID to column index 7
-    df[7] = df[0]
+    Files are opened with a 4 MiB buffer so each table reaches the disk in
+    a few large writes rather than many 8 KiB ones, which matters on
+    network/HPC filesystems.
+    """
+    mode = 'a' if append else 'w'
+    with open(path, mode, buffering=4 * 1024 * 1024, encoding='utf-8', newline='') as fh:
+        df.to_csv(fh, header=not append, sep='\t', index=False, decimal=".", lineterminator='\n')
 
-    # If species = "S", split into 'locus' (base ID) and 'Last' (version info)
-    if species == "S":
-        df[[7, 8]] = df[7].str.split(".", expand=True)
-    else:
-        # For species = "A", keep the same value in column 8
-        df[8] = df[7]
 
-    # --------------------------------------------------------
-    # Apply padj/log2FC filter functions to classify genes
-    # Each function returns GeneID if condition met, else ""
-    # --------------------------------------------------------
-    df[9]  = df.apply(padj_low_005, axis=1)
-    df[10] = df.apply(log2FC_high_0_padj_low_005, axis=1)
-    df[11] = df.apply(log2FC_low_0_and_padj_low005, axis=1)
-    df[12] = df.apply(padj_low_001, axis=1)
-    df[13] = df.apply(log2FC_high_1_and_padj_low_001, axis=1)
-    df[14] = df.apply(log2FC_low_minus_1_and_padj_low_001, axis=1)
-    df[15] = df.apply(log2FC_higher_1_or_log2FC_low_minus_1_and_padj_001, axis=1)
+def input_separator(path):
+    """Return the separator for a DESeq2 result file, sniffed from its first line.
 
-    # --------------------------------------------------------
-    # Save intermediate annotated file (before merging annotation data)
-    # --------------------------------------------------------
-    df.to_csv(
-        f"output/annotated/{file_name}",
-        header=header_name,
-        sep='\t',
-        index=False,
-        decimal="."
-    )
+    DESeq2 results are tab-delimited and are split on tabs only; files
+    without tabs fall back to splitting on runs of any whitespace.
+    """
+    with open(path) as fh:
+        first_line = fh.readline()
+    return '\t' if '\t' in first_line else r'\s+'
 
-    # Reload to ensure clean header handling for merging
-    df = pd.read_csv(
-        f"output/annotated/{file_name}",
-        sep='\t',
-        low_memory=False,
-        decimal="."
-    )
 
-    # Add 'locus' column from 'loc'
-    df['locus'] = df['loc']
+def process_file(path, annotation_index, species):
+    """Annotate one DESeq2 result file and write its annotated, expression and sigOnly outputs.
 
-    # --------------------------------------------------------
-    # Merge with annotation file based on species mode
-    # --------------------------------------------------------
-    if species == "S":
-        # Merge on 'locus' and drop extra columns not needed anymore
-        inner_join = pd.merge(df, annotation_file, on='locus', how='left')
-        inner_join = inner_join.drop(['Last', 'loc'], axis=1)
-    elif species == "A":
-        # Merge directly on 'GeneID'
-        inner_join = pd.merge(df, annotation_file, on=Accession, how='left')
+    `annotation_index` is the annotation table indexed by its join key
+    (see index_annotation). The file is read in chunks of `chunk_rows`
+    rows, so memory use stays flat however large the input is.
+    """
+    file_name = os.path.basename(path)
 
     # --------------------------------------------------------
-    # Save final annotated file for this input dataset
+    # Load DESeq2 result file chunk by chunk
+    # Column index: 0=GeneID, 1=Base mean, 2=log2FC, 3=StdErr,
+    #               4=Wald-Stats, 5=P-value, 6=P-adj
     # --------------------------------------------------------
-    inner_join.to_csv(
-        f"output/annotated/annotated_{file_name}",
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    print(f"{file_name} is done with annotation")
-
-      
-# ------------------------------------------------------------
-# GOseq-compatible classification functions
-# ------------------------------------------------------------
-# These functions are similar to the earlier padj/log2FC filters,
-# but instead of returning the GeneID (or ""), they return the
-# string "True" or "False". This is the required format for GOseq
-# expression category input.
-#
-# row[2] = log2FC
-# row[6] = padj
-# ------------------------------------------------------------
-
-def b_padj_low_005(row):
-    """Return True if padj < 0.05, else False."""
-    return "True" if row[6] < 0.05 else "False"
+    with pd.read_csv(
+        path,
+        header=None,        # no header expected
+        sep=input_separator(path),
+        decimal='.',        # decimal separator is a dot
+        dtype={0: str, 1: 'float64', 2: 'float64', 3: 'float64',
+               4: 'float64', 5: 'float64', 6: 'float64'},
+        chunksize=chunk_rows
+    ) as chunks:
+        # If the input has a header row, add skiprows=1 to the call above
+        for chunk_number, deseq in enumerate(chunks):
+            # The first chunk creates each output file; later chunks append
+            process_chunk(deseq, file_name, annotation_index, species, append=chunk_number > 0)
 
-def b_log2FC_high_0_padj_low_005(row):
-    """Return True if padj < 0.05 and log2FC > 0 (upregulated), else False."""
-    return "True" if (row[6] < 0.05 and row[2] > 0) else "False"
+    # Progress feedback for this input file
+    print(f"{file_name} is done with annotation, expression and sig selection")
 
-def b_log2FC_low_0_and_padj_low005(row):
-    """Return True if padj < 0.05 and log2FC < 0 (downregulated), else False."""
-    return "True" if (row[6] < 0.05 and row[2] < 0) else "False"
 
-def b_padj_low_001(row):
-    """Return True if padj < 0.01, else False."""
-    return "True" if row[6] < 0.01 else "False"
+def process_chunk(deseq, file_name, annotation_index, species, append):
+    """Write the annotated, expression and sigOnly rows for one chunk of a DESeq2 file."""
+    # Extract file name without extension for naming outputs
+    file_nam_without_ext = file_name.split(".")
 
-def b_log2FC_high_1_and_padj_low_001(row):
-    """Return True if padj < 0.01 and log2FC > 1 (strong upregulation), else False."""
-    return "True" if (row[6] < 0.01 and row[2] > 1) else "False"
+    # Remove 'gene:' prefix from GeneID strings
+    deseq[0] = deseq[0].str.removeprefix('gene:')
 
-def b_log2FC_low_minus_1_and_padj_low_001(row):
-    """Return True if padj < 0.01 and log2FC < -1 (strong downregulation), else False."""
-    return "True" if (row[6] < 0.01 and row[2] < -1) else "False"
+    # padj/log2FC filter masks, in `lista` order, shared by the annotated
+    # and expression outputs (padj is column 6, log2FC is column 2)
+    masks = threshold_masks(deseq[6].to_numpy(), deseq[2].to_numpy())
 
-def b_log2FC_higher_1_or_log2FC_low_minus_1_and_padj_001(row):
-    """Return True if padj < 0.01 and |log2FC| > 1 (strong up/down regulation), else False."""
-    return "True" if (row[6] < 0.01 and (row[2] < -1 or row[2] > 1)) else "False"
+    # ------------------------------------------------------------
+    # Create annotated file and classify genes into subsets
+    # based on padj and log2FC thresholds (UP/DOWN regulated)
+    # ------------------------------------------------------------
+    df = deseq.copy()
 
-# ------------------------------------------------------------
-# Compute GOseq-compatible expression tables
-# (True/False classification for each filtering condition)
-# ------------------------------------------------------------
-for file_name in os.listdir('input'):
     # --------------------------------------------------------
-    # Load DESeq2 results
+    # Classify genes by padj/log2FC thresholds
+    # Each column (7-13) holds the GeneID if the condition is met, else ""
     # --------------------------------------------------------
-    df = pd.read_csv(
-        f"input/{file_name}",
-        header=None,        # no header expected
-        sep=r'\s+',         # split on any whitespace (tab or space)
-        decimal='.'         # decimal separator is a dot
-    )
-
-    # Optional adjustments if needed for specific files:
-    # df = df.iloc[1:, :]                     # drop header row
-    # df = df.rename(columns=df.iloc[0])      # set first row as header
+    gid = df[0].to_numpy()
 
-    # Convert log2FC (index 2) and padj (index 6) to floats
-    df = df.astype({2: 'float', 6: 'float'})
-
-    # Remove 'gene:' prefix from GeneID (column 0)
-    df = df.replace({0: 'gene:'}, {0: ''}, regex=True)
-
-    # Extract file name without extension for naming outputs
-    file_nam_without_ext = file_name.split(".")
-
-    # --------------------------------------------------------
-    # Ensure output/expression directory exists
-    # --------------------------------------------------------
-    if not os.path.exists("output/expression"):
-        os.mkdir("output/expression")
+    for column, mask in enumerate(masks, start=7):
+        df[column] = np.where(mask, gid, "")
 
     # --------------------------------------------------------
-    # Apply each GOseq classification function and save result
-    # For each filter:
-    # - Apply function to return "True"/"False"
-    # - Drop statistical columns, keep only GeneID + Expression
-    # - Save as tab-delimited file for GOseq
+    # Save intermediate annotated file (before merging annotation data)
     # --------------------------------------------------------
+    # Attach header names in memory so the merge can use them directly
+    df.columns = header_name
 
-    # Filter 1: padj < 0.05
-    df2 = df.copy()
-    df2[9] = df.apply(b_padj_low_005, axis=1)
-    df2 = df2.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df2.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[0]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Filter 2: padj < 0.05 & log2FC > 0 (upregulated)
-    df3 = df.copy()
-    df3[9] = df.apply(b_log2FC_high_0_padj_low_005, axis=1)
-    df3 = df3.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df3.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[1]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Filter 3: padj < 0.05 & log2FC < 0 (downregulated)
-    df4 = df.copy()
-    df4[9] = df.apply(b_log2FC_low_0_and_padj_low005, axis=1)
-    df4 = df4.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df4.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[2]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Filter 4: padj < 0.01
-    df5 = df.copy()
-    df5[9] = df.apply(b_padj_low_001, axis=1)
-    df5 = df5.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df5.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[3]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Filter 5: padj < 0.01 & log2FC > 1 (strong upregulation)
-    df6 = df.copy()
-    df6[9] = df.apply(b_log2FC_high_1_and_padj_low_001, axis=1)
-    df6 = df6.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df6.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[4]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
+    write_table(df, f"output/annotated/{file_name}", append)
 
-    # Filter 6: padj < 0.01 & log2FC < -1 (strong downregulation)
-    df7 = df.copy()
-    df7[9] = df.apply(b_log2FC_low_minus_1_and_padj_low_001, axis=1)
-    df7 = df7.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df7.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[5]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Filter 7: padj < 0.01 & |log2FC| > 1 (strong up/down regulation)
-    df8 = df.copy()
-    df8[9] = df.apply(b_log2FC_higher_1_or_log2FC_low_minus_1_and_padj_001, axis=1)
-    df8 = df8.drop([1, 2, 3, 4, 5, 6], axis=1)
-    df8.to_csv(
-        f"output/expression/expression_{file_nam_without_ext[0]}_{lista[6]}.tab",
-        header=[header_name[0], Expression],
-        sep='\t',
-        index=False,
-        decimal="."
-    )
-
-    # Progress message
-    print(f"{file_name} is done with the expression")
-
-# ------------------------------------------------------------
-# Create per-threshold "significant only" tables (+ annotations)
-#   - Writes UP/DOWN subsets into output/sigOnly/
-#   - Joins with the selected annotation workbook
-# ------------------------------------------------------------
-
-# Column headers for the temporary standardized TSV we write/read back
-name_header = ["GeneID", "Base mean", "log2FC", "StdErr", "Wald-Stats", "P-value", "P-adj", "locus"]
-
-for file_name in os.listdir('input'):
     # --------------------------------------------------------
-    # Load DESeq2 results
+    # Add the 'locus' join key
     # --------------------------------------------------------
-    dfs = pd.read_csv(
-        f"input/{file_name}",
-        header=None,        # no header expected
-        sep=r'\s+',         # split on any whitespace (tabs or spaces)
-        decimal='.'         # decimal separator is a dot
-    )
-
-    # Some input exports include a header row; drop if present
-    dfs = dfs.iloc[1:, :]
-
-    # Ensure numeric types for filters: log2FC (2), padj (6)
-    dfs = dfs.astype({2: 'float', 6: 'float'})
+    if species == "S":
+        # For species = "S", the GeneID up to the first '.' (the version
+        # suffix is dropped); np.char.partition splits the whole column
+        # in one C pass
+        df['locus'] = np.char.partition(gid.astype(str), ".")[:, 0]
+    else:
+        # For species = "A", the GeneID itself
+        df['locus'] = gid
 
     # --------------------------------------------------------
-    # Make sure the output/sigOnly directory exists
+    # Merge with annotation file based on species mode
     # --------------------------------------------------------
-    if not os.path.exists("output/sigOnly"):
-        os.mkdir("output/sigOnly")
+    if species == "S":
+        # Merge on 'locus' (base ID without version suffix)
+        inner_join = join_annotation(df, annotation_index, 'locus')
+    elif species == "A":
+        # Merge directly on 'GeneID'
+        inner_join = join_annotation(df, annotation_index, Accession)
 
     # --------------------------------------------------------
-    # Normalize GeneID text and derive locus/version columns
+    # Save final annotated rows for this input dataset
     # --------------------------------------------------------
-    # Remove 'gene:' prefix from GeneID (column 0)
-    dfs = dfs.replace({0: 'gene:'}, {0: ''}, regex=True)
-
-    # Copy GeneID to column 7 for downstream splitting
-    dfs[7] = dfs[0]
+    write_table(inner_join, f"output/annotated/annotated_{file_name}", append)
 
-    if species == "S":
-        # For species S: split versioned IDs: <locus>.<version...>
-        dfs[[7, 8]] = dfs[7].str.split(".", expand=True)
-    else:
-        # For species A: keep a mirror of the ID in col 8 (not used later)
-        dfs[8] = dfs[0]
-
-    # Drop the extra column 8 (we keep col 7 as 'locus' when S)
-    dfs = dfs.drop([8], axis=1)
+    # ------------------------------------------------------------
+    # Compute GOseq-compatible expression tables
+    # (True/False classification for each filtering condition)
+    # ------------------------------------------------------------
 
     # --------------------------------------------------------
-    # Write a standardized TSV and reload with headers
-    # (This guarantees consistent column names before merging)
+    # Apply each GOseq classification and save result
+    # For each filter (names correspond to entries in `lista`):
+    # - Mark genes True/False; the boolean column is written as the
+    #   literal "True"/"False" text GOseq expects
+    # - Build a GeneID + Expression table from just those two columns
+    # - Save as tab-delimited file for GOseq
     # --------------------------------------------------------
-    dfs.to_csv(
-        f"output/{file_name}",
-        header=name_header[0:8],
-        sep='\t',
-        index=False
-    )
-    dfs = pd.read_csv(
-        f"output/{file_name}",
-        sep='\t',
-        low_memory=False
-    )
+    for name, mask in zip(lista, masks):
+        expression = pd.DataFrame({
+            header_name[0]: deseq[0],
+            Expression: mask
+        })
+        write_table(
+            expression,
+            f"output/expression/expression_{file_nam_without_ext[0]}_{name}.tab",
+            append
+        )
+
+    # ------------------------------------------------------------
+    # Create per-threshold "significant only" tables (+ annotations)
+    #   - Writes UP/DOWN subsets into output/sigOnly/
+    #   - Includes the selected annotation workbook columns
+    # ------------------------------------------------------------
 
     # --------------------------------------------------------
-    # Merge with annotation data depending on species mode
+    # Reuse the annotated table from above instead of joining again:
+    # drop the filter columns so only the DESeq2 statistics, 'locus'
+    # and the annotation columns remain
     # --------------------------------------------------------
-    if species == "S":
-        # Join on 'locus' (base ID without version suffix)
-        dfs = pd.merge(dfs, annotation_file, on='locus', how='left')
-    elif species == "A":
-        # Join directly on 'GeneID'
-        dfs = pd.merge(dfs, annotation_file, on=Accession, how='left')
+    dfs = inner_join.drop(columns=header_name[7:])
 
     # --------------------------------------------------------
     # Generate significance-filtered subsets and save
     # (Names correspond to entries in `lista`)
     # --------------------------------------------------------
-    file_nam_without_ext = file_name.split(".")
+    # Masks are rebuilt here because the annotation join can repeat genes
+    # that match more than one annotation row
+    sig_masks = threshold_masks(dfs["P-adj"].to_numpy(), dfs["log2FC"].to_numpy())
+
+    for name, mask in zip(lista, sig_masks):
+        write_table(
+            dfs.iloc[np.flatnonzero(mask)],
+            f"output/sigOnly/sig_{file_nam_without_ext[0]}_{name}.tab",
+            append
+        )
+
+
+def _encode_cache_value(value):
+    """json.dump hook: tag datetimes, which Excel makes of date-like gene names."""
+    if type(value) is datetime.datetime:
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} cannot be cached")
+
+
+def _decode_cache_value(obj):
+    """json.load hook: turn tagged datetimes back into datetime objects."""
+    if "__datetime__" in obj:
+        return datetime.datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def load_annotation(path):
+    """Load an annotation workbook, caching the parsed table in annotations/cache/.
+
+    Parsing .xlsx is the slowest step for large workbooks, so the first run
+    saves the table as JSON and later runs read that while it is newer than
+    the workbook. The cache is optional: if it cannot be read the workbook is
+    parsed again, and if it cannot be written the run continues without it.
+    """
+    cache_dir = os.path.join(os.path.dirname(path), "cache")
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(path)}.json")
+
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        try:
+            with open(cache_path, encoding='utf-8') as handle:
+                cached = json.load(handle, object_hook=_decode_cache_value)
+            return pd.DataFrame(cached["data"], columns=cached["columns"]).astype(
+                dict(zip(cached["columns"], cached["dtypes"]))
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Damaged or unreadable cache: fall back to the workbook
+
+    annotation_file = pd.read_excel(path)
+
+    cached = annotation_file.to_dict('split', index=False)
+    cached["dtypes"] = [str(dtype) for dtype in annotation_file.dtypes]
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first so an interrupted run never
+        # leaves a half-written cache behind
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(cached, handle, default=_encode_cache_value)
+        os.replace(temp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        # Caching is optional (e.g. read-only folder): carry on without it
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return annotation_file
+
+
+def index_annotation(annotation_file, species):
+    """Index the annotation table by its join key ('GeneID' for "A", 'locus' for "S").
+
+    Building the index once lets every file use an indexed join instead of
+    pd.merge rebuilding a hash table on each call. The keys are left as
+    plain strings: converting each file's IDs to categories shared with the
+    annotation costs more than the join itself.
+    """
+    key = 'locus' if species == "S" else Accession
+
+    # Not sorted: rows sharing a key must keep their workbook order, as
+    # they did with pd.merge
+    annotation_index = annotation_file.set_index(key)
+
+    # Integer/boolean columns become float/object up front, as the join does
+    # as soon as one gene has no annotation row; this keeps each column's
+    # formatting the same in every chunk of a file
+    upcast = {
+        column: 'float64' if dtype.kind in 'iu' else 'object'
+        for column, dtype in annotation_index.dtypes.items()
+        if dtype.kind in 'iub'
+    }
+    return annotation_index.astype(upcast)
+
+
+def join_annotation(df, annotation_index, key):
+    """Left-join the annotation columns onto `df` by its `key` column.
+
+    When every key appears once in the annotation, rows are looked up
+    directly with reindex, which is faster than a join. Otherwise
+    DataFrame.join is used so that a gene matching several annotation rows
+    is repeated, as pd.merge did. Overlapping column names get the same
+    _x/_y suffixes either way.
+    """
+    if not annotation_index.index.is_unique:
+        return df.join(annotation_index, on=key, how='left', lsuffix='_x', rsuffix='_y')
+
+    annotation_rows = annotation_index.reindex(df[key].to_numpy())
+    annotation_rows.index = df.index
+
+    overlap = df.columns.intersection(annotation_rows.columns)
+    return pd.concat([
+        df.rename(columns=lambda c: f"{c}_x" if c in overlap else c),
+        annotation_rows.rename(columns=lambda c: f"{c}_y" if c in overlap else c)
+    ], axis=1)
 
-    # 1) padj < 0.05
-    df2 = dfs[dfs["P-adj"] < 0.05]
-    df2.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[0]}.tab",
-        sep='\t', index=False, decimal="."
-    )
 
-    # 2) padj < 0.05 & log2FC > 0 (up)
-    df3 = dfs[(dfs["P-adj"] < 0.05) & (dfs["log2FC"] > 0)]
-    df3.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[1]}.tab",
-        sep='\t', index=False, decimal="."
-    )
-
-    # 3) padj < 0.05 & log2FC < 0 (down)
-    df4 = dfs[(dfs["P-adj"] < 0.05) & (dfs["log2FC"] < 0)]
-    df4.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[2]}.tab",
-        sep='\t', index=False, decimal="."
-    )
-
-    # 4) padj < 0.01
-    df5 = dfs[dfs["P-adj"] < 0.01]
-    df5.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[3]}.tab",
-        sep='\t', index=False, decimal="."
-    )
-
-    # 5) padj < 0.01 & log2FC > 1 (strong up)
-    df6 = dfs[(dfs["P-adj"] < 0.01) & (dfs["log2FC"] > 1)]
-    df6.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[4]}.tab",
-        sep='\t', index=False, decimal="."
-    )
-
-    # 6) padj < 0.01 & log2FC < -1 (strong down)
-    df7 = dfs[(dfs["P-adj"] < 0.01) & (dfs["log2FC"] < -1)]
-    df7.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[5]}.tab",
-        sep='\t', index=False, decimal="."
-    )
-
-    # 7) padj < 0.01 & |log2FC| > 1 (strong up or down)
-    df8 = dfs[(dfs["P-adj"] < 0.01) & ((dfs["log2FC"] > 1) | (dfs["log2FC"] < -1))]
-    df8.to_csv(
-        f"output/sigOnly/sig_{file_nam_without_ext[0]}_{lista[6]}.tab",
-        sep='\t', index=False, decimal="."
+# ------------------------------------------------------------
+# Worker process setup
+# ------------------------------------------------------------
+# The annotation workbook is loaded once in the parent process and
+# handed to each worker when it starts, instead of once per file.
+_worker_annotation_index = None
+_worker_species = None
+
+
+def _init_worker(annotation_index, species):
+    """Store the shared annotation table and species mode in this worker."""
+    global _worker_annotation_index, _worker_species
+    _worker_annotation_index = annotation_index
+    _worker_species = species
+
+
+def _process_in_worker(path):
+    """Run process_file in a worker using the annotation table from _init_worker."""
+    process_file(path, _worker_annotation_index, _worker_species)
+
+
+if __name__ == "__main__":
+    # ------------------------------------------------------------
+    # Welcome message
+    # ------------------------------------------------------------
+    print(
+        "#######\nWelcome to postDESeq2\n"
+        "Place all files in the folder you want to process.\n"
+        "Each file should be tab-delimited and contain the following columns:\n"
+        "GeneID, Base mean, log2FC, StdErr, Wald-Stats, P-value, P-adj.\n"
+        "You will also need to provide an annotation file.\n"
     )
-
-    # Progress feedback for this input file
-    print(f"{file_name} is done with sig selection")
-
-print("\nFINISHED!")
+    # ------------------------------------------------------------
+    # Load annotation index file
+    # ------------------------------------------------------------
+    # annotations.xlsx contains two columns:
+    #   type      - short code to identify the annotation set
+    #   name_file - Excel file name inside the 'annotations/' folder
+    annotations = pd.read_excel("annotations.xlsx")
+
+    # Display available annotation sets and prompt user to choose one by 'type' code
+    annotation = input(
+        f'{annotations[["type", "name_file"]].to_string(index=False)} \n'
+        "Type the code from the 'type' column above to select an annotation file: "
+    ).upper()
+
+    # Retrieve the corresponding annotation file name from the table
+    annotation_f = annotations.loc[annotations['type'] == annotation, 'name_file'].item()
+
+    # Load the selected annotation Excel file from the 'annotations' folder
+    annotation_file = load_annotation(f"annotations/{annotation_f}")
+
+    # Ensure the output directories exist once, before any file is processed
+    for output_dir in ("output", "output/annotated", "output/expression", "output/sigOnly"):
+        os.makedirs(output_dir, exist_ok=True)
+
+    # ------------------------------------------------------------
+    # Process every DESeq2 result file in the input folder
+    # Files are independent, so they are spread across CPU cores
+    # ------------------------------------------------------------
+    paths = [f"input/{file_name}" for file_name in os.listdir('input')]
+    annotation_index = index_annotation(annotation_file, species)
+
+    if len(paths) <= 1:
+        # A single file gains nothing from worker processes
+        for path in paths:
+            process_file(path, annotation_index, species)
+    else:
+        # Windows allows at most 61 worker processes
+        with ProcessPoolExecutor(
+            max_workers=min(len(paths), os.cpu_count() or 1, 61),
+            initializer=_init_worker,
+            initargs=(annotation_index, species)
+        ) as executor:
+            list(executor.map(_process_in_worker, paths))
+
+    print("\nFINISHED!")